@@ -1,29 +1,92 @@
 import argparse
+import ctypes
+import http.client
+import json
 import logging
-import math
+import multiprocessing
 import os
+import queue
+import re
+import shutil
+import struct
 import sys
 import textwrap
+import threading
 import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import timedelta
 from pathlib import Path
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse
 
 import requests
 from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from urllib3 import Retry
+from urllib3.exceptions import HTTPError as URLLib3Error
+
+try:
+    from stream_unzip import UnzipError, stream_unzip
+except ImportError:  # optional, --unzip then extracts from the downloaded zip file
+    stream_unzip = None
+    UnzipError = zipfile.BadZipFile
+
+try:
+    from isal import isal_zlib
+except ImportError:  # optional, zipfile then inflates with zlib
+    isal_zlib = None
 
 # config
 DOMAIN = "www.dropbox.com"
 WGET_AGENT = "Wget/1.19.4 (linux-gnu)"
 RETRIES = Retry(total=10, backoff_factor=2)
 ERASE = "\033[2K"
+# bytes per read/write, a read of 0 bytes would look like the end of the download
+CHUNK_SIZE = max(1, int(os.environ.get("DROPBOX_CHUNK", 4 * 2**20)))
+MAX_WORKERS = 8  # parallel connections per download when byte ranges are supported
+SYNC_INTERVAL = 8 * 2**20  # bytes written between writeback hints
+SYNC_FILE_RANGE_WRITE = 2
+PROGRESS_INTERVAL = 0.5  # seconds between progress bar refreshes
+EXTRACT_PARALLEL_MIN = 64 * 2**20  # uncompressed bytes worth starting extract processes for
+DL_PARAM = re.compile(r"([?&])dl=\d+(?=[&#]|$)")
+SUFFIXES = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("dropbox-downloader")
 
+# shared across downloads so connections to Dropbox are kept alive between links
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=RETRIES),
+)
+
+# set when the user interrupts concurrent downloads, they stop at their next chunk
+_cancelled = threading.Event()
+
+# downloads in progress per target zip file
+_path_locks: dict[Path, threading.RLock] = {}
+_path_locks_guard = threading.Lock()
+
+# extract processes shared by all downloads, created on first use
+_extract_executor = None
+_extract_executor_guard = threading.Lock()
+
+# held while zipfile is patched to use ISA-L in this process
+_isal_guard = threading.Lock()
+
+# os has no sync_file_range binding, call into libc where available (Linux)
+try:
+    _sync_file_range = ctypes.CDLL(None, use_errno=True).sync_file_range
+    _sync_file_range.argtypes = (
+        ctypes.c_int,
+        ctypes.c_int64,
+        ctypes.c_int64,
+        ctypes.c_uint,
+    )
+except (OSError, AttributeError, TypeError):  # TypeError: no CDLL(None) on Windows
+    _sync_file_range = None
+
 
 # helper function
 
@@ -32,16 +95,365 @@ def format_bytes(bytes):
     """function returns formatted bytes"""
     if bytes == 0:
         return "0B"
-    suffixes = ["B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB"]
-    index = int(math.floor(math.log(bytes, 1024)))
-    formatted = round(float(bytes) / (1024**index), 2)
-    return f"{formatted} {suffixes[index]}"
+    # every 10 bits is one step of 1024
+    index = min((int(bytes).bit_length() - 1) // 10, len(SUFFIXES) - 1)
+    formatted = round(bytes / (1 << (10 * index)), 2)
+    return f"{formatted} {SUFFIXES[index]}"
+
+
+def read_meta(meta_file_path: Path) -> dict:
+    """function returns the etag and size recorded for a finished download"""
+    try:
+        return json.loads(meta_file_path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def download_url(link):
+    """function returns link with the dl=1 query parameter that makes it download as zip"""
+    url, sep, fragment = link.partition("#")
+    url, count = DL_PARAM.subn(r"\1dl=1", url, count=1)
+    if not count:
+        # no dl parameter yet, start or extend the query string
+        url += ("&" if "?" in url else "?") + "dl=1"
+    return url + sep + fragment
+
+
+def _preallocate(fd, size):
+    """function reserves size bytes on disk for fd and hints sequential access"""
+    if size <= 0:
+        return
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        elif sys.platform == "darwin":
+            import fcntl
+
+            # fstore_t: F_ALLOCATEALL, F_PEOFPOSMODE, offset, length, bytes allocated
+            fstore = struct.pack("Iiqqq", 4, 3, 0, size, 0)
+            fcntl.fcntl(fd, getattr(fcntl, "F_PREALLOCATE", 42), fstore)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+    except OSError:
+        # preallocation is only an optimisation, e.g. not every filesystem supports it
+        pass
+
+
+def _start_writeback(fd, offset, length):
+    """function asks the kernel to start flushing a written range of fd without waiting"""
+    if _sync_file_range is not None:
+        _sync_file_range(fd, offset, length, SYNC_FILE_RANGE_WRITE)
+
+
+def _write_stream(raw, fd, offset):
+    """function writes the urllib3 response raw into fd from offset and yields the offset after each chunk"""
+    # urllib3's read() and readinto() build a new bytes object per chunk, the
+    # http.client response underneath can fill one reused buffer when nothing has to
+    # be decoded. Only with a known length: a short body then just ends early and
+    # fails the size check, chunked bodies are left to urllib3's error handling
+    fp = None
+    if raw.headers.get("content-length") and not raw.headers.get("content-encoding"):
+        fp = raw._fp
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    # write straight to the descriptor, a buffered file object would copy every chunk
+    # once more (os.splice cannot help, the data is only plaintext after TLS).
+    # readinto fills the whole buffer, so this is one pwrite per CHUNK_SIZE and there
+    # is nothing left for batched submission (pwritev, io_uring) to amortise
+    unsynced = 0
+    while True:
+        if _cancelled.is_set():
+            raise KeyboardInterrupt
+        if fp is not None:
+            chunk = view[: fp.readinto(buf)]
+        else:
+            chunk = raw.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if hasattr(os, "pwrite"):
+            os.pwrite(fd, chunk, offset)
+        else:
+            # sequential single-stream downloads only, ranged ones need pwrite
+            os.write(fd, chunk)
+        offset += len(chunk)
+        unsynced += len(chunk)
+        if unsynced >= SYNC_INTERVAL:
+            # overlap disk writeback with the network instead of flushing at close
+            _start_writeback(fd, offset - unsynced, unsynced)
+            unsynced = 0
+        yield offset
+
+    if fp is not None:
+        # urllib3 did not see the end of the body, hand the connection back ourselves
+        raw.release_conn()
+
+
+def _download_range(url, fd, start, end, pbar, stop, progress, etag=None):
+    """function downloads bytes start-end of url and writes them into fd at the same offset"""
+    headers = {
+        "Range": f"bytes={start}-{end}",
+        "User-Agent": WGET_AGENT,
+        "Accept-Encoding": "identity",
+    }
+    if etag:
+        # the server sends the whole file instead of the range if it changed
+        headers["If-Range"] = etag
+    with requests.Session() as session:
+        session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=RETRIES),
+        )
+        resp = session.get(url, headers=headers, timeout=60, stream=True)
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise requests.exceptions.HTTPError(
+                f"{url} ignored byte range {start}-{end}", response=resp
+            )
+
+        offset = start
+        for written in _write_stream(resp.raw, fd, start):
+            pbar.update(written - offset)
+            offset = progress[start] = written
+            if stop.is_set():
+                break
+
+    if offset != end + 1 and not stop.is_set():
+        raise OSError(f"incomplete byte range {start}-{end} from {url}")
+    return offset - start
+
+
+def download_ranges(
+    url, file_path, size, offset=0, workers=MAX_WORKERS, etag=None, **tqdm_kwargs
+):
+    """function downloads url from offset into file_path over several ranged connections and returns the file size"""
+    # integer ceiling division, floats lose precision on very large sizes
+    part_size = -(-(size - offset) // workers)
+    ranges = [
+        (start, min(start + part_size, size) - 1)
+        for start in range(offset, size, part_size)
+    ]
+    progress = {start: start for start, _ in ranges}
+    stop = threading.Event()
+    # keep the bytes of an earlier attempt when resuming
+    flags = os.O_WRONLY | os.O_CREAT | (0 if offset else os.O_TRUNC)
+    fd = os.open(file_path, flags, 0o644)
+    try:
+        _preallocate(fd, size)
+        with tqdm(
+            total=size,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            mininterval=PROGRESS_INTERVAL,
+            **tqdm_kwargs,
+        ) as pbar, ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(
+                    _download_range, url, fd, start, end, pbar, stop, progress, etag
+                )
+                for start, end in ranges
+            ]
+            try:
+                return offset + sum(future.result() for future in futures)
+            except BaseException:
+                # let the remaining workers bail out instead of finishing their ranges
+                stop.set()
+                raise
+    except BaseException:
+        # keep only the bytes that arrived without gaps, a later run resumes after them
+        complete = offset
+        for start, end in ranges:
+            complete = progress[start]
+            if complete <= end:
+                break
+        os.ftruncate(fd, complete)
+        raise
+    finally:
+        os.close(fd)
+
+
+def _extract_target(root: Path, name: str) -> Path:
+    """function returns where zip entry name is extracted to under root"""
+    target = (root / name).resolve()
+    if not target.is_relative_to(root):
+        raise UnzipError(f"{name} would be extracted outside {root}")
+    return target
+
+
+def _use_isal():
+    """function makes zipfile in this process inflate with ISA-L"""
+    # zipfile looks both up at call time, ISA-L inflates several times faster
+    zipfile.zlib = isal_zlib
+    zipfile.crc32 = isal_zlib.crc32
+
+
+def _extract_entries(zip_path, entries):
+    """function extracts (name, target) entries of the zip at zip_path"""
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for name, target in entries:
+            # extractall copies through small buffers, use the download chunk size
+            with zip_file.open(name) as src, open(
+                target, "wb", buffering=CHUNK_SIZE
+            ) as dst:
+                shutil.copyfileobj(src, dst, length=CHUNK_SIZE)
+
+
+def _extract_pool() -> ProcessPoolExecutor:
+    """function returns the process pool shared by every extraction"""
+    global _extract_executor
+    with _extract_executor_guard:
+        if _extract_executor is None:
+            # spawn rather than fork, downloads may be running in other threads
+            _extract_executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+                # the workers only extract, so zipfile may stay patched there
+                initializer=_use_isal if isal_zlib is not None else None,
+            )
+        return _extract_executor
+
+
+def _extract_local(zip_path, entries):
+    """function extracts (name, target) entries of the zip at zip_path in this process"""
+    if isal_zlib is None:
+        _extract_entries(zip_path, entries)
+        return
+    # patch zipfile only while extracting, other users in this process keep zlib
+    with _isal_guard:
+        zlib, crc32 = zipfile.zlib, zipfile.crc32
+        _use_isal()
+        try:
+            _extract_entries(zip_path, entries)
+        finally:
+            zipfile.zlib, zipfile.crc32 = zlib, crc32
+
+
+def extract_zip(zip_path, directory_path: Path, workers=None):
+    """function extracts all entries of the zip at zip_path into directory_path"""
+    root = directory_path.resolve()
+    with zipfile.ZipFile(zip_path) as zip_file:
+        infos = zip_file.infolist()
+
+    entries = []
+    for info in infos:
+        target = _extract_target(root, info.filename)
+        if info.is_dir():
+            target.mkdir(parents=True, exist_ok=True)
+            continue
+        # create directories up front so the workers do not race on them
+        target.parent.mkdir(parents=True, exist_ok=True)
+        entries.append((info.file_size, info.filename, target))
+
+    workers = min(workers or os.cpu_count() or 1, len(entries))
+    # starting interpreters costs more than inflating a small archive
+    if workers <= 1 or sum(entry[0] for entry in entries) < EXTRACT_PARALLEL_MIN:
+        _extract_local(zip_path, [(name, target) for _, name, target in entries])
+        return
+
+    # deal entries out largest first so every process gets a similar share
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    batches = [
+        [(name, target) for _, name, target in entries[i::workers]]
+        for i in range(workers)
+    ]
+    # concurrent downloads queue their batches on one pool, so no more than
+    # cpu_count processes run at once
+    list(_extract_pool().map(_extract_entries, [zip_path] * workers, batches))
+
+
+def stream_extract(raw, directory_path: Path, **tqdm_kwargs):
+    """function extracts a zip archive into directory_path while reading it from raw"""
+    root = directory_path.resolve()
+    with tqdm.wrapattr(
+        raw, "read", mininterval=PROGRESS_INTERVAL, **tqdm_kwargs
+    ) as raw:
+
+        def chunks():
+            while chunk := raw.read(CHUNK_SIZE):
+                if _cancelled.is_set():
+                    raise KeyboardInterrupt
+                yield chunk
+
+        written = []
+        created = []
+
+        def make_dirs(path):
+            # remember the directories this extraction adds, to remove them on failure
+            missing = []
+            while not path.exists():
+                missing.append(path)
+                path = path.parent
+            for path in reversed(missing):
+                path.mkdir(exist_ok=True)
+                created.append(path)
+
+        try:
+            for file_name, _, unzipped_chunks in stream_unzip(
+                chunks(), chunk_size=CHUNK_SIZE
+            ):
+                try:
+                    name = file_name.decode()
+                except UnicodeDecodeError:
+                    name = file_name.decode("cp437")
+                target = _extract_target(root, name)
+                if name.endswith("/"):
+                    make_dirs(target)
+                    # entries must be consumed before stream_unzip moves on
+                    for _ in unzipped_chunks:
+                        pass
+                    continue
+                make_dirs(target.parent)
+                written.append(target)
+                with open(target, "wb", buffering=CHUNK_SIZE) as file:
+                    for chunk in unzipped_chunks:
+                        file.write(chunk)
+        except BaseException:
+            # do not leave a partly extracted folder that looks complete, whether
+            # the zip, the connection or the user stopped it
+            for target in written:
+                target.unlink(missing_ok=True)
+            for path in reversed(created):
+                try:
+                    path.rmdir()
+                except OSError:  # holds files this extraction did not write
+                    pass
+            raise
+
+
+def _path_lock(file_path: Path) -> threading.RLock:
+    """function returns the lock guarding downloads to file_path"""
+    with _path_locks_guard:
+        # reentrant, a download may start over for the same file_path
+        return _path_locks.setdefault(file_path, threading.RLock())
+
+
+def unzip_file(file_path: Path, directory_path: Path, retain_zip=False):
+    """function extracts the zip at file_path into directory_path"""
+    directory_path.mkdir(parents=True, exist_ok=True)
+    extract_zip(file_path, directory_path)
+
+    logger.info(f"Extracted {file_path} to {directory_path}")
+
+    # check if zip files should be deleted
+    if not retain_zip:
+        os.remove(file_path)
+        file_path.with_suffix(".zip.meta").unlink(missing_ok=True)
+        logger.info(f"Removed {file_path}")
 
 
 def download_file(
-    link: str, destination: str | Path = ".", unzip=False, retain_zip=False
+    link: str,
+    destination: str | Path = ".",
+    unzip=False,
+    retain_zip=False,
+    position: int | None = None,
+    session: requests.Session | None = None,
+    streaming=True,
 ):
     parsed_URL = urlparse(link)
+    # kept for starting over, a one-part destination is replaced below
+    requested_destination = destination
     destination = Path(destination)
 
     # check if link belongs to www.dropbox.com
@@ -49,121 +461,291 @@ def download_file(
         logger.error(f"{link} does not belong to {DOMAIN}, skipping it ")
         return
 
-    # add/edit query to make link downloadable as zip
-    query = parsed_URL.query
-    query = query.replace("dl=0", "dl=1")
-    if not query.endswith("dl=1"):
-        if query:
-            # multiple query parameters (non-empty query string)
-            query += "&"
-        query += "dl=1"
-    zipped_download_URL = urlunparse(parsed_URL._replace(query=query))
+    zipped_download_URL = download_url(link)
     logger.info(f"Downloading from URL : {zipped_download_URL}")
 
-    with requests.Session() as session:
-        session.mount("https://", HTTPAdapter(max_retries=RETRIES))
-
-        try:
-            zip_file_resp = session.get(
-                link.replace("dl=0", "dl=1"),
-                headers={"User-Agent": WGET_AGENT},
-                timeout=60,
-                stream=True,
-            )
-            start_time = time.time()
-            zip_file_resp.raise_for_status()
+    session = session or _SESSION
+
+    try:
+        zip_file_resp = session.get(
+            zipped_download_URL,
+            # a 206 reply tells us the server supports parallel ranged downloads,
+            # the zip is already compressed so ask not to have it compressed again
+            headers={
+                "Range": "bytes=0-",
+                "User-Agent": WGET_AGENT,
+                "Accept-Encoding": "identity",
+            },
+            timeout=60,
+            stream=True,
+        )
+        start_time = time.time()
+        zip_file_resp.raise_for_status()
+
+    except requests.exceptions.ConnectionError:
+        logger.error(f"Unable to retrieve {link}, due to network error")
+        return
 
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Unable to retrieve {link}, due to network error")
-            return
+    except requests.exceptions.Timeout:
+        logger.error(f"Unable to retrieve {link}, connection timed out")
+        return
 
-        except requests.exceptions.Timeout:
-            logger.error(f"Unable to retrieve {link}, connection timed out")
-            return
+    except requests.exceptions.HTTPError as err:
+        logger.error(f"{err}")
+        err.response.close()
+        return
 
-        except requests.exceptions.HTTPError as err:
-            logger.error(f"{err}")
+    if len(destination.parts) == 1:
+        zip_file_name = str(destination)
+        destination = Path.cwd()  # current directory
+    else:
+        # get filename from response headers
+        try:
+            zip_file_name = (
+                zip_file_resp.headers["content-disposition"]
+                .split(";")[1]
+                .split('"')[1]
+            )
+        except KeyError:
+            zip_file_name = "dropbox.zip"
+
+    # get file size from response headers
+    zip_file_size = int(zip_file_resp.headers.get("content-length") or 0)
+    fmt_zip_file_size = format_bytes(zip_file_size)
+    # path to store the file
+    file_path = (destination.resolve() / zip_file_name).with_suffix(".zip")
+    # path to store file with temporary filename
+    temp_file_path = file_path.with_suffix(".zip.part")
+    # path to store the etag and size of a finished download
+    meta_file_path = file_path.with_suffix(".zip.meta")
+    # path to store the etag and size of the object the temporary file holds
+    part_meta_file_path = file_path.with_suffix(".zip.part.meta")
+    directory_path = destination / zip_file_name.replace(".zip", "")
+
+    # links saved under the same name must not write the same files at once
+    lock = _path_lock(file_path)
+    if not lock.acquire(blocking=False):
+        logger.info(f"Waiting for another download of {file_path}")
+        zip_file_resp.close()
+        with lock:
+            pass
+        # the probe may be stale by now, start over
+        return download_file(
+            link, requested_destination, unzip, retain_zip, position, session
+        )
+
+    try:
+        etag = zip_file_resp.headers.get("etag")
+        meta = {"etag": etag, "size": zip_file_size}
+        # only a strong etag identifies the bytes, weak ones may match different
+        # bytes and without one only the size could be compared
+        strong_etag = etag if etag and not etag.startswith("W/") else None
+        # skip files that an earlier run already downloaded completely
+        if (
+            strong_etag
+            and file_path.exists()
+            and file_path.stat().st_size == zip_file_size
+            and read_meta(meta_file_path) == meta
+        ):
+            logger.info(f"{file_path} is already downloaded, skipping it")
+            zip_file_resp.close()
+            if unzip:
+                unzip_file(file_path, directory_path, retain_zip)
             return
 
-        if len(destination.parts) == 1:
-            zip_file_name = str(destination)
-            destination = Path.cwd()  # current directory
-        else:
-            # get filename from response headers
-            try:
-                zip_file_name = (
-                    zip_file_resp.headers["content-disposition"]
-                    .split(";")[1]
-                    .split('"')[1]
-                )
-            except KeyError:
-                zip_file_name = "dropbox.zip"
-
-        # get file size from response headers
-        zip_file_size = float(zip_file_resp.headers.get("content-length", 0))
-        fmt_zip_file_size = format_bytes(zip_file_size)
-        # path to store the file
-        file_path = (destination.resolve() / zip_file_name).with_suffix(".zip")
-        # path to store file with temporary filename
-        temp_file_path = file_path.with_suffix(".zip.part")
         Path(destination).mkdir(parents=True, exist_ok=True)
         logger.info(f"Downloading file : {zip_file_name}")
 
+        # unzip while downloading when the zip itself is not kept
+        streaming_unzip = (
+            streaming and unzip and not retain_zip and stream_unzip is not None
+        )
+
         short_link = textwrap.shorten(zipped_download_URL, width=50, placeholder="...")
         short_file_path = textwrap.shorten(str(temp_file_path), width=50, placeholder="...")
 
         current_size = 0
         try:
-            chunk_size = 2**20
-            with open(temp_file_path, "wb") as zipFile:  # write file to disk
-                for chunk in tqdm(
-                    zip_file_resp.iter_content(chunk_size=chunk_size),
-                    # total=math.ceil(zip_file_size // chunk_size),
-                    unit="MB",
+            if streaming_unzip:
+                zip_file_resp.raw.decode_content = True
+                stream_extract(
+                    zip_file_resp.raw,
+                    directory_path,
+                    total=zip_file_size or None,
+                    postfix=f"{fmt_zip_file_size}",
+                    desc=f"{short_link} -> {directory_path}",
+                    position=position,
+                )
+            elif (
+                zip_file_resp.status_code == 206
+                and zip_file_size > 0
+                and hasattr(os, "pwrite")
+            ):
+                # the ranged workers open their own connections
+                zip_file_resp.close()
+                # a partial file left by an earlier attempt only needs its missing
+                # tail, if it holds the same version of the file
+                resume_size = (
+                    temp_file_path.stat().st_size if temp_file_path.exists() else 0
+                )
+                if (
+                    not 0 < resume_size < zip_file_size
+                    or not strong_etag
+                    or read_meta(part_meta_file_path) != meta
+                ):
+                    resume_size = 0
+                else:
+                    logger.info(
+                        f"Resuming {zip_file_name} from {format_bytes(resume_size)}"
+                    )
+                part_meta_file_path.write_text(json.dumps(meta))
+                current_size = download_ranges(
+                    zip_file_resp.url,
+                    temp_file_path,
+                    zip_file_size,
+                    offset=resume_size,
+                    etag=strong_etag,
+                    postfix=f"{fmt_zip_file_size}",
+                    desc=f"{short_link} -> {short_file_path}",
+                    position=position,
+                )
+            else:
+                # read the urllib3 response directly, iter_content adds a generator
+                # and extra checks for every chunk
+                zip_file_resp.raw.decode_content = True
+                part_meta_file_path.write_text(json.dumps(meta))
+                with open(temp_file_path, "wb", buffering=0) as zipFile, tqdm(
+                    total=zip_file_size or None,
+                    unit="B",
                     unit_scale=True,
+                    unit_divisor=1024,
+                    mininterval=PROGRESS_INTERVAL,
                     postfix=f"{fmt_zip_file_size}",
                     desc=f"{short_link} -> {short_file_path}",
-                ):
-                    if chunk:
-                        current_size += len(chunk)
-                        zipFile.write(chunk)
-                        # zipFile.flush()
-                        # os.fsync(zipFile.fileno())
+                    position=position,
+                ) as pbar:  # write file to disk
+                    _preallocate(zipFile.fileno(), zip_file_size)
+                    try:
+                        for written in _write_stream(
+                            zip_file_resp.raw, zipFile.fileno(), 0
+                        ):
+                            pbar.update(written - current_size)
+                            current_size = written
+                    finally:
+                        # drop any preallocated space the stream did not fill, so a
+                        # partial file can be resumed
+                        zipFile.truncate(current_size)
+
+        except (
+            requests.exceptions.RequestException,
+            URLLib3Error,
+            http.client.HTTPException,
+            UnzipError,
+            OSError,
+        ) as err:
+            if streaming_unzip and isinstance(err, UnzipError):
+                # stream_unzip cannot read every zip, zipfile may still extract it
+                logger.warning(
+                    f"Unable to extract {link} while downloading ({err}),"
+                    " downloading the zip file instead"
+                )
+                zip_file_resp.close()
+                return download_file(
+                    link,
+                    requested_destination,
+                    unzip,
+                    retain_zip,
+                    position,
+                    session,
+                    False,
+                )
+            logger.error(f"Unable to download {link}: {err}")
+            return
 
         except KeyboardInterrupt:
             logger.error("Interrupted by user, removing incomplete file")
-            try:
-                os.remove(temp_file_path)
-            except OSError:
-                logger.error(f"Unable to remove {temp_file_path}")
-                pass
+            for path in (temp_file_path, part_meta_file_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    logger.error(f"Unable to remove {path}")
             sys.exit(0)
 
-    # print messaage when download is over
-    if os.stat(temp_file_path).st_size == zip_file_size:
+        finally:
+            # hand the connection back to the shared session's pool
+            zip_file_resp.close()
+
+        if streaming_unzip:
+            elapsed_time = timedelta(seconds=time.time() - start_time)
+            logger.info(f"Extracted {link} to {directory_path} in {elapsed_time}")
+            return
+
+        # the byte count is only checked when the server announced a size
+        if zip_file_size and current_size != zip_file_size:
+            logger.error(
+                f"Incomplete download of {link}, received {format_bytes(current_size)}"
+                f" of {fmt_zip_file_size}"
+            )
+            return
+
+        # print messaage when download is over
         temp_file_path.replace(file_path)
+        meta_file_path.write_text(json.dumps(meta))
+        part_meta_file_path.unlink(missing_ok=True)
         elapsed_time = timedelta(seconds=time.time() - start_time)
         logger.info(f"Downloaded {link} to {file_path} in" f" {elapsed_time}")
 
-    # if unzip argument is used unzip files
-    if unzip:
-        with zipfile.ZipFile(file_path, "r") as zipFile:
-            directory_name = zip_file_name.replace(".zip", "")
-            directory_path = destination / directory_name
-            directory_path.mkdir(parents=True, exist_ok=True)
-            zipFile.extractall(directory_path)
+        # if unzip argument is used unzip files
+        if unzip:
+            unzip_file(file_path, directory_path, retain_zip)
+    finally:
+        lock.release()
 
-        logger.info(f"Extracted {file_path} to {directory_path}")
 
-        # check if zip files should be deleted
-        if not retain_zip:
-            os.remove(file_path)
-            logger.info(f"Removed {file_path}")
+def download_files(
+    links: list[str], destination, unzip=False, retain_zip=False, workers=MAX_WORKERS
+):
+    workers = max(1, min(workers, len(links)))
+    if len(Path(destination).parts) == 1:
+        # a one-part destination is the zip name, every link would share it
+        workers = 1
+    if workers == 1:
+        # nothing to overlap, keep Ctrl-C handling in download_file
+        for suppliedLink in links:
+            download_file(suppliedLink, destination, unzip, retain_zip)
+        return
 
+    # each running download takes a free progress bar line
+    positions = queue.SimpleQueue()
+    for position in range(workers):
+        positions.put(position)
 
-def download_files(links: list[str], destination, unzip=False, retain_zip=False):
-    for suppliedLink in links:
-        download_file(suppliedLink, destination, unzip, retain_zip)
+    def download(suppliedLink):
+        position = positions.get()
+        try:
+            download_file(suppliedLink, destination, unzip, retain_zip, position)
+        except Exception as err:
+            # one failed link should not abort the others
+            logger.error(f"Unable to download {suppliedLink}: {err}")
+        finally:
+            positions.put(position)
+
+    # downloads mostly wait on the network, so run several at once
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [executor.submit(download, suppliedLink) for suppliedLink in links]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        # Ctrl-C only reaches the main thread, tell the workers to stop; each one
+        # removes its incomplete file like a single download would
+        logger.error("Interrupted by user, stopping downloads")
+        _cancelled.set()
+        executor.shutdown(cancel_futures=True)
+        sys.exit(0)
+    executor.shutdown()
 
 
 if __name__ == "__main__":